@@ -1,36 +1,174 @@
+# Network I/O here runs on the uvloop event loop installed in main.py (non-Windows only).
 import nextcord
 from nextcord.ext import commands
 import os
 import asyncio
-import json
-import requests
-import sqlite3
+import aiohttp
+import aiosqlite
+import orjson
+import re
 import traceback
-from datetime import datetime
-from typing import List, Dict, Optional, Union
+import weakref
+from collections import Counter, OrderedDict, deque
+from datetime import datetime, timedelta
+from typing import List, Dict, Optional, Set, Tuple, Union
+
+# The semantic response cache is optional: `pip install fastembed numpy` to enable it,
+# otherwise every message goes to the API
+try:
+    import numpy as np
+    from fastembed import TextEmbedding
+except ImportError:
+    np = None
+    TextEmbedding = None
+
+API_ERROR_REPLY = "Sorry, I couldn't generate a response right now. Try again later?"
+NETWORK_ERROR_REPLY = "Network error occurred. Please try again later."
+
+SUMMARY_PREFIX = "Earlier: "
+SUMMARY_STOPWORDS = {
+    "about", "after", "again", "all", "also", "and", "any", "are", "been", "before", "being",
+    "but", "can", "could", "did", "does", "doing", "dont", "for", "from", "get", "got", "had",
+    "has", "have", "having", "her", "hey", "him", "his", "how", "its", "just", "like", "lol",
+    "made", "make", "more", "much", "not", "now", "omg", "one", "only", "our", "out", "really",
+    "say", "see", "she", "some", "that", "than", "the", "them", "then", "there", "these", "they",
+    "thing", "things", "think", "this", "those", "too", "very", "want", "was", "way", "were",
+    "what", "when", "where", "which", "while", "who", "why", "with", "would", "yeah", "yes",
+    "you", "your", "yours", "lumi",
+}
+
+def heuristic_summary(messages: List[Dict[str, str]], top_k: int = 10) -> str:
+    """Summarize messages as their most frequent names and keywords, without an LLM call."""
+    counts = Counter()
+    names = {}
+    for msg in messages:
+        content = msg["content"]
+        if content.startswith(SUMMARY_PREFIX):
+            content = content[len(SUMMARY_PREFIX):]
+        for match in re.finditer(r"[A-Za-z][A-Za-z']{2,}", content):
+            word = match.group()
+            key = word.lower().replace("'", "")
+            if key in SUMMARY_STOPWORDS:
+                continue
+            
+            # Capitalized words mid-sentence are likely names, so weigh them higher
+            if word[0].isupper():
+                names.setdefault(key, word)
+                before = content[:match.start()].rstrip()
+                counts[key] += 2 if before and before[-1] not in ".!?" else 1
+            else:
+                counts[key] += 1
+    
+    return ", ".join(names.get(key, key) for key, _ in counts.most_common(top_k))
 
 class LumiCog(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.api_key = os.getenv("GROQ_API_KEY")
-        self.conversation_history = {}  # Store conversation history by user ID
-        self.max_history = 3  # Remember 3 previous messages
+        self._headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {self.api_key}"
+        }
+        # Most recently active users' histories; older ones live in the history table
+        self.conversation_history: OrderedDict = OrderedDict()
+        self.max_cached_histories = 1000
+        self._history_locks: weakref.WeakValueDictionary = weakref.WeakValueDictionary()
+        self.history_token_budget = 1000  # Rough prompt budget for conversation history
+        self.history_keep_turns = 4  # Messages kept verbatim when older ones are summarized
+        self.history_idle_timeout = timedelta(minutes=30)  # Idle time before a fresh conversation
+        self.last_active: Dict[str, datetime] = {}  # Last saved turn for each cached user
+        self._perm_error_msg = "You need administrator permissions to use this command."
         self.system_prompt = {
             "role": "system",
             "content": "You are Lumi, an 18-year-old girl who enjoys talking with friends on Discord. You're friendly, helpful, and a bit playful. You have many interests like music, art, games, and hanging out with friends. Keep your responses short, casual, and genuine like a real teenager would talk. Don't mention that you're an AI or that you're powered by any model. Just be Lumi."
         }
         
-        # Initialize database
+        # Matches both <@id> and <@!id> mentions of the bot, compiled once the bot user is known
+        self._mention_re: Optional[re.Pattern] = None
+
+        # In-memory copy of allowed_channels as (guild_id, channel_id) pairs
+        self.allowed: Set[Tuple[str, str]] = set()
+
+        # Database and HTTP session are opened once the event loop is running
         self.db_path = "lumi_config.db"
-        self.init_database()
+        self.db: Optional[aiosqlite.Connection] = None
+        self.session: Optional[aiohttp.ClientSession] = None
+        # Every DB write holds this lock for its whole transaction, so a rollback
+        # can never undo another coroutine's uncommitted statements
+        self._db_lock = asyncio.Lock()
+
+        # Usage rows waiting to be written by the background flush task
+        self._log_buffer: deque = deque()
+        self._log_ready = asyncio.Event()
+        self._flush_task: Optional[asyncio.Task] = None
+        self.log_flush_interval = 5  # Seconds between flushes
+        self.log_batch_size = 50  # Flush early once this many rows are buffered
+
+        # Semantic response cache: unit-length prompt embeddings and the replies they got
+        self.embedder = None
+        self.cache_size = 2048  # Max cached replies before LRU eviction
+        self.cache_threshold = 0.9  # Cosine similarity needed to reuse a reply
+        self.cache_embs = None
+        self.cache_replies: List[str] = []
+        self.cache_last_used = None
+        self._cache_clock = 0
+        self._embedder_task: Optional[asyncio.Task] = None
+
+        # Startup runs on the bot loop; handlers await this task before touching the DB or session
+        self._ready_task = self.bot.loop.create_task(self.cog_load())
+        self._ready_task.add_done_callback(self._report_load_error)
+
+    def _report_load_error(self, task: asyncio.Task):
+        """Log a failed startup as soon as it happens instead of on first use."""
+        if not task.cancelled() and task.exception():
+            print(f"LumiCog failed to load: {task.exception()}")
+            print("".join(traceback.format_exception(task.exception())))
 
-    def init_database(self):
+    async def cog_load(self):
+        """Open the shared database connection and HTTP session."""
+        self.db = await aiosqlite.connect(self.db_path)
+        # WAL lets stats reads run alongside log writes; mmap avoids a pread per page
+        await self.db.execute("PRAGMA journal_mode=WAL")
+        await self.db.execute("PRAGMA synchronous=NORMAL")
+        await self.db.execute("PRAGMA temp_store=MEMORY")
+        await self.db.execute("PRAGMA mmap_size=268435456")
+        await self.init_database()
+        # Keep warm connections to the Groq API and cache its DNS lookups
+        connector = aiohttp.TCPConnector(
+            limit_per_host=32,
+            ttl_dns_cache=600,
+            resolver=aiohttp.AsyncResolver()
+        )
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=10)
+        )
+        self._flush_task = asyncio.create_task(self._flush_loop())
+        # The embedding model can take a while to download, so don't hold up startup for it
+        if TextEmbedding is not None:
+            self._embedder_task = asyncio.create_task(self.load_embedder())
+
+    def cog_unload(self):
+        """Close the HTTP session and database connection when the cog is unloaded."""
+        if not self._ready_task.done():
+            self._ready_task.cancel()
+        if self.session and not self.session.closed:
+            self.bot.loop.create_task(self.session.close())
+        if self.db:
+            self.bot.loop.create_task(self._close_database())
+
+    async def _close_database(self):
+        """Stop the flush task, write any buffered usage rows, then close the database connection."""
+        if self._flush_task:
+            self._flush_task.cancel()
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+        await self._flush_logs()
+        await self.db.close()
+
+    async def init_database(self):
         """Initialize SQLite database with necessary tables."""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
         # Create allowed channels table
-        cursor.execute('''
+        await self.db.execute('''
         CREATE TABLE IF NOT EXISTS allowed_channels (
             guild_id TEXT,
             channel_id TEXT,
@@ -41,7 +179,7 @@ class LumiCog(commands.Cog):
         ''')
         
         # Create usage stats table for monitoring
-        cursor.execute('''
+        await self.db.execute('''
         CREATE TABLE IF NOT EXISTS usage_stats (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             user_id TEXT,
@@ -53,149 +191,354 @@ class LumiCog(commands.Cog):
         )
         ''')
         
-        conn.commit()
-        conn.close()
-
-    def is_channel_allowed(self, guild_id: str, channel_id: str) -> bool:
-        """Check if a channel is in the allowed list for this guild."""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        # Covering index so the stats queries never touch the table itself
+        await self.db.execute('''
+        CREATE INDEX IF NOT EXISTS idx_usage_guild
+        ON usage_stats (guild_id, channel_id, user_id)
+        ''')
+        
+        # Create conversation history table
+        await self.db.execute('''
+        CREATE TABLE IF NOT EXISTS history (
+            user_id TEXT,
+            idx INTEGER,
+            role TEXT,
+            content TEXT,
+            PRIMARY KEY (user_id, idx)
+        )
+        ''')
         
-        cursor.execute(
-            "SELECT COUNT(*) FROM allowed_channels WHERE guild_id = ? AND channel_id = ?", 
-            (guild_id, channel_id)
+        # Create conversation activity table, used to start fresh after a long break
+        await self.db.execute('''
+        CREATE TABLE IF NOT EXISTS history_activity (
+            user_id TEXT PRIMARY KEY,
+            last_active TEXT
         )
-        result = cursor.fetchone()[0] > 0
+        ''')
         
-        conn.close()
-        return result
+        await self.db.commit()
+
+        # Load allowed channels into memory
+        async with self.db.execute("SELECT guild_id, channel_id FROM allowed_channels") as cursor:
+            self.allowed = {(row[0], row[1]) for row in await cursor.fetchall()}
+
+    def is_channel_allowed(self, guild_id: str, channel_id: str) -> bool:
+        """Check if a channel is in the allowed list for this guild."""
+        return (guild_id, channel_id) in self.allowed
 
     def get_allowed_channels(self, guild_id: str) -> List[str]:
         """Get all allowed channels for a guild."""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute(
-            "SELECT channel_id FROM allowed_channels WHERE guild_id = ?", 
-            (guild_id,)
-        )
-        channels = [row[0] for row in cursor.fetchall()]
-        
-        conn.close()
-        return channels
+        return sorted(cid for (gid, cid) in self.allowed if gid == guild_id)
 
     def log_usage(self, user_id: str, guild_id: str, channel_id: str, 
                   message_length: int, response_length: int):
-        """Log usage statistics."""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
+        """Queue usage statistics for the next background flush."""
         timestamp = datetime.now().isoformat()
         
-        cursor.execute(
-            """
-            INSERT INTO usage_stats 
-            (user_id, guild_id, channel_id, timestamp, message_length, response_length) 
-            VALUES (?, ?, ?, ?, ?, ?)
-            """, 
+        self._log_buffer.append(
             (user_id, guild_id, channel_id, timestamp, message_length, response_length)
         )
+        if len(self._log_buffer) >= self.log_batch_size:
+            self._log_ready.set()
+
+    async def _flush_logs(self):
+        """Write all buffered usage rows in a single transaction."""
+        if not self._log_buffer:
+            return
+        
+        async with self._db_lock:
+            rows = list(self._log_buffer)
+            self._log_buffer.clear()
+            
+            try:
+                await self.db.executemany(
+                    """
+                    INSERT INTO usage_stats 
+                    (user_id, guild_id, channel_id, timestamp, message_length, response_length) 
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    """, 
+                    rows
+                )
+                await self.db.commit()
+            except BaseException:
+                # Undo the partial write and put the rows back so the next flush retries them
+                self._log_buffer.extendleft(reversed(rows))
+                await self.db.rollback()
+                raise
+
+    async def _flush_loop(self):
+        """Flush usage rows every few seconds, or sooner when the buffer fills up."""
+        while True:
+            try:
+                await asyncio.wait_for(self._log_ready.wait(), timeout=self.log_flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._log_ready.clear()
+            
+            try:
+                await self._flush_logs()
+            except Exception as e:
+                print(f"Error flushing usage stats: {e}")
+
+    def _history_lock(self, user_id: str) -> asyncio.Lock:
+        """Get the lock guarding a user's history; it is dropped once nobody holds it."""
+        lock = self._history_locks.get(user_id)
+        if lock is None:
+            lock = self._history_locks[user_id] = asyncio.Lock()
+        return lock
+
+    async def get_history(self, user_id: str) -> List[Dict[str, str]]:
+        """Get a user's conversation history, loading it from the database on a cache miss.
+
+        Callers must hold the user's _history_lock so two misses can't load separate copies.
+        """
+        if user_id in self.conversation_history:
+            self.conversation_history.move_to_end(user_id)
+            return self.conversation_history[user_id]
+        
+        async with self.db.execute(
+            "SELECT role, content FROM history WHERE user_id = ? ORDER BY idx",
+            (user_id,)
+        ) as cursor:
+            history = [{"role": row[0], "content": row[1]} for row in await cursor.fetchall()]
+        
+        async with self.db.execute(
+            "SELECT last_active FROM history_activity WHERE user_id = ?",
+            (user_id,)
+        ) as cursor:
+            row = await cursor.fetchone()
+        
+        self.conversation_history[user_id] = history
+        if row:
+            self.last_active[user_id] = datetime.fromisoformat(row[0])
+        
+        # Drop the least recently active users once the cache is full; every turn is
+        # already saved, so they can be loaded back from the database
+        while len(self.conversation_history) > self.max_cached_histories:
+            old_user_id, _ = self.conversation_history.popitem(last=False)
+            self.last_active.pop(old_user_id, None)
+        
+        return history
+
+    async def save_history(self, user_id: str, history: List[Dict[str, str]]):
+        """Replace a user's stored conversation history and mark them as active now."""
+        now = datetime.now()
+        async with self._db_lock:
+            try:
+                await self.db.execute("DELETE FROM history WHERE user_id = ?", (user_id,))
+                await self.db.executemany(
+                    "INSERT INTO history (user_id, idx, role, content) VALUES (?, ?, ?, ?)",
+                    [(user_id, idx, msg["role"], msg["content"]) for idx, msg in enumerate(history)]
+                )
+                await self.db.execute(
+                    "INSERT OR REPLACE INTO history_activity (user_id, last_active) VALUES (?, ?)",
+                    (user_id, now.isoformat())
+                )
+                await self.db.commit()
+            except BaseException:
+                # Don't leave the DELETE pending for the next commit to apply
+                await self.db.rollback()
+                raise
+        self.last_active[user_id] = now
+
+    def is_idle(self, user_id: str) -> bool:
+        """Check if a user's last turn is older than the idle timeout (or unknown)."""
+        last_active = self.last_active.get(user_id)
+        return last_active is None or datetime.now() - last_active > self.history_idle_timeout
+
+    async def load_embedder(self):
+        """Load the sentence embedding model used by the response cache."""
+        try:
+            self.embedder = await asyncio.to_thread(
+                TextEmbedding, "sentence-transformers/all-MiniLM-L6-v2"
+            )
+            self.cache_embs = np.zeros((self.cache_size, 384), dtype=np.float32)
+            self.cache_last_used = np.zeros(self.cache_size, dtype=np.int64)
+        except Exception as e:
+            print(f"Response cache disabled, could not load embedding model: {e}")
+            self.embedder = None
+
+    async def embed(self, text: str):
+        """Return the unit-length embedding of a prompt, or None if the cache is disabled."""
+        if self.embedder is None or not text:
+            return None
         
-        conn.commit()
-        conn.close()
+        emb = await asyncio.to_thread(lambda: next(iter(self.embedder.embed([text]))))
+        emb = np.asarray(emb, dtype=np.float32)
+        norm = np.linalg.norm(emb)
+        return emb / norm if norm else None
+
+    def get_cached_response(self, emb) -> Optional[str]:
+        """Return the reply of the most similar cached prompt, if it is similar enough.
+
+        The cache is shared by all users, so it only holds replies to opening messages:
+        the first message of a new conversation, which is sent with no earlier turns or
+        summary. A conversation starts over after history_idle_timeout without a turn,
+        and process_message passes no embedding for any other message.
+        """
+        if emb is None or not self.cache_replies:
+            return None
+        
+        sims = self.cache_embs[:len(self.cache_replies)] @ emb
+        best = int(sims.argmax())
+        if sims[best] < self.cache_threshold:
+            return None
+        
+        self._cache_clock += 1
+        self.cache_last_used[best] = self._cache_clock
+        return self.cache_replies[best]
+
+    def cache_response(self, emb, response: str):
+        """Store a reply in the cache, evicting the least recently used entry when full."""
+        if emb is None:
+            return
+        
+        if len(self.cache_replies) < self.cache_size:
+            slot = len(self.cache_replies)
+            self.cache_replies.append(response)
+        else:
+            slot = int(self.cache_last_used.argmin())
+            self.cache_replies[slot] = response
+        
+        self._cache_clock += 1
+        self.cache_embs[slot] = emb
+        self.cache_last_used[slot] = self._cache_clock
+
+    async def cog_before_invoke(self, ctx):
+        # Commands need the database, so wait for startup (raising if it failed)
+        await self._ready_task
 
     @commands.Cog.listener()
     async def on_ready(self):
+        self._mention_re = re.compile(rf'<@!?{self.bot.user.id}>')
         print(f'LumiCog is ready! Logged in as {self.bot.user}')
 
     @commands.Cog.listener()
     async def on_message(self, message):
+        bot_id = self.bot.user.id
+        
         # Ignore messages from the bot itself
-        if message.author == self.bot.user:
+        if message.author.id == bot_id:
             return
 
-        # Handle DMs separately since they don't have guild_id
-        if isinstance(message.channel, nextcord.DMChannel):
-            if self.bot.user.mentioned_in(message) or True:  # Always respond in DMs
-                await self.process_message(message)
+        # Always respond in DMs, which have no guild
+        if message.guild is None:
+            await self.process_message(message)
             return
 
-        # For guild messages, check if it's in an allowed channel or mentions the bot
-        guild_id = str(message.guild.id)
-        channel_id = str(message.channel.id)
+        # Respond if explicitly mentioned
+        if message.mention_everyone or any(user.id == bot_id for user in message.mentions):
+            await self.process_message(message)
+            return
         
-        # Respond if explicitly mentioned or if in an allowed channel
-        if (self.bot.user.mentioned_in(message) or 
-            self.is_channel_allowed(guild_id, channel_id)):
+        # Otherwise only respond in allowed channels
+        if self.is_channel_allowed(str(message.guild.id), str(message.channel.id)):
             await self.process_message(message)
 
     async def process_message(self, message):
-        # Show typing indicator
-        async with message.channel.typing():
+        user_id = str(message.author.id)
+        
+        # Handle one message per user at a time, from loading their history to saving it
+        async with self._history_lock(user_id):
+            # Show typing indicator
+            async with message.channel.typing():
+                try:
+                    # Wait for startup, raising here if it failed
+                    await self._ready_task
+                    
+                    # Load conversation history for this user; keep our own reference since
+                    # other messages may evict this user from the cache while we await
+                    history = await self.get_history(user_id)
+                    
+                    # A user coming back after a long break starts a fresh conversation
+                    if history and self.is_idle(user_id):
+                        history = []
+                        self.conversation_history[user_id] = history
+                    
+                    # Clean the message content
+                    if self._mention_re is None:
+                        self._mention_re = re.compile(rf'<@!?{self.bot.user.id}>')
+                    clean_content = self._mention_re.sub('', message.content).strip()
+                    
+                    # Add the new message to history
+                    history.append({
+                        "role": "user",
+                        "content": clean_content
+                    })
+                    
+                    # Summarize older messages once the history gets too long
+                    history = self.compact_history(history)
+                    if user_id in self.conversation_history:
+                        self.conversation_history[user_id] = history
+                    
+                    # Prepare the messages for the API call
+                    messages = [self.system_prompt, *history]
+                    
+                    # Reuse a cached reply for near-duplicate prompts, otherwise call the Groq API.
+                    # Only opening messages are cached, since later replies depend on the user's history
+                    emb = await self.embed(clean_content) if len(history) == 1 else None
+                    response = self.get_cached_response(emb)
+                    if response is None:
+                        response = await self.call_groq_api(messages)
+                        if response not in (API_ERROR_REPLY, NETWORK_ERROR_REPLY):
+                            self.cache_response(emb, response)
+                    
+                    # Send the response
+                    await message.reply(response)
+                    
+                except Exception as e:
+                    print(f"Error processing message: {e}")
+                    print(traceback.format_exc())
+                    await message.reply("Oops! Something went wrong. Try again in a bit?")
+                    return
+            
+            # The user already has their reply, so failures past this point are only logged
+            # Add the assistant's response to history
+            history.append({
+                "role": "assistant",
+                "content": response
+            })
+            
+            # Summarize older messages once the history gets too long
+            history = self.compact_history(history)
+            if user_id in self.conversation_history:
+                self.conversation_history[user_id] = history
+            
+            # Save the finished turn so history survives restarts
             try:
-                user_id = str(message.author.id)
-                
-                # Initialize conversation history for this user if it doesn't exist
-                if user_id not in self.conversation_history:
-                    self.conversation_history[user_id] = []
-                
-                # Clean the message content
-                clean_content = message.content.replace(f'<@{self.bot.user.id}>', '').strip()
-                
-                # Add the new message to history
-                self.conversation_history[user_id].append({
-                    "role": "user",
-                    "content": clean_content
-                })
-                
-                # Keep only the last 'max_history' messages
-                if len(self.conversation_history[user_id]) > self.max_history:
-                    self.conversation_history[user_id] = self.conversation_history[user_id][-self.max_history:]
-                
-                # Prepare the messages for the API call
-                messages = [self.system_prompt]
-                messages.extend(self.conversation_history[user_id])
-                
-                # Call the Groq API
-                response = self.call_groq_api(messages)
-                
-                # Send the response
-                await message.reply(response)
-                
-                # Add the assistant's response to history
-                self.conversation_history[user_id].append({
-                    "role": "assistant",
-                    "content": response
-                })
-                
-                # Ensure we only keep the last 'max_history' exchanges
-                if len(self.conversation_history[user_id]) > self.max_history:
-                    self.conversation_history[user_id] = self.conversation_history[user_id][-self.max_history:]
-                
-                # Log usage for analytics
-                guild_id = str(message.guild.id) if message.guild else "DM"
-                channel_id = str(message.channel.id)
-                
-                self.log_usage(
-                    user_id=user_id,
-                    guild_id=guild_id,
-                    channel_id=channel_id,
-                    message_length=len(clean_content),
-                    response_length=len(response)
-                )
-                
+                await self.save_history(user_id, history)
             except Exception as e:
-                print(f"Error processing message: {e}")
-                print(traceback.format_exc())
-                await message.reply("Oops! Something went wrong. Try again in a bit?")
+                print(f"Error saving conversation history: {e}")
+            
+            # Log usage for analytics
+            guild_id = str(message.guild.id) if message.guild else "DM"
+            channel_id = str(message.channel.id)
+            
+            self.log_usage(
+                user_id=user_id,
+                guild_id=guild_id,
+                channel_id=channel_id,
+                message_length=len(clean_content),
+                response_length=len(response)
+            )
 
-    def call_groq_api(self, messages):
-        """Call the Groq API and return the response text."""
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.api_key}"
-        }
+    def compact_history(self, history: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        """Fold older messages into a short summary once the history nears the token budget."""
+        # Roughly 4 characters per token
+        tokens = sum(len(msg["content"]) // 4 for msg in history)
+        if tokens <= 0.8 * self.history_token_budget or len(history) <= self.history_keep_turns:
+            return history
+        
+        old_msgs = history[:-self.history_keep_turns]
+        summary = heuristic_summary(old_msgs)
+        compacted = history[-self.history_keep_turns:]
+        if summary:
+            compacted.insert(0, {"role": "system", "content": SUMMARY_PREFIX + summary})
         
+        return compacted
+
+    async def call_groq_api(self, messages):
+        """Call the Groq API and return the response text."""
         data = {
             "messages": messages,
             "model": "mixtral-8x7b-32768",
@@ -207,21 +550,20 @@ class LumiCog(commands.Cog):
         }
         
         try:
-            response = requests.post(
+            async with self.session.post(
                 "https://api.groq.com/openai/v1/chat/completions",
-                headers=headers,
-                data=json.dumps(data),
-                timeout=10  # Add timeout to prevent hanging
-            )
-            
-            if response.status_code == 200:
-                return response.json()["choices"][0]["message"]["content"]
-            else:
-                print(f"API error: {response.status_code} - {response.text}")
-                return "Sorry, I couldn't generate a response right now. Try again later?"
+                headers=self._headers,
+                data=orjson.dumps(data)
+            ) as response:
+                if response.status == 200:
+                    result = await response.json(loads=orjson.loads)
+                    return result["choices"][0]["message"]["content"]
+                else:
+                    print(f"API error: {response.status} - {await response.text()}")
+                    return API_ERROR_REPLY
         except Exception as e:
             print(f"Request error: {e}")
-            return "Network error occurred. Please try again later."
+            return NETWORK_ERROR_REPLY
 
     @commands.command(name="addchannel")
     @commands.has_permissions(administrator=True)
@@ -240,25 +582,22 @@ class LumiCog(commands.Cog):
         added_by = str(ctx.author.id)
         added_at = datetime.now().isoformat()
         
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
         try:
-            cursor.execute(
-                """
-                INSERT OR REPLACE INTO allowed_channels
-                (guild_id, channel_id, added_by, added_at)
-                VALUES (?, ?, ?, ?)
-                """,
-                (guild_id, channel_id, added_by, added_at)
-            )
-            conn.commit()
+            async with self._db_lock:
+                await self.db.execute(
+                    """
+                    INSERT OR REPLACE INTO allowed_channels
+                    (guild_id, channel_id, added_by, added_at)
+                    VALUES (?, ?, ?, ?)
+                    """,
+                    (guild_id, channel_id, added_by, added_at)
+                )
+                await self.db.commit()
+            self.allowed.add((guild_id, channel_id))
             
             await ctx.send(f"✅ I'll now chat in {channel.mention}!")
         except Exception as e:
             await ctx.send(f"Error adding channel: {e}")
-        finally:
-            conn.close()
 
     @commands.command(name="removechannel")
     @commands.has_permissions(administrator=True)
@@ -275,24 +614,22 @@ class LumiCog(commands.Cog):
         guild_id = str(ctx.guild.id)
         channel_id = str(channel.id)
         
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
         try:
-            cursor.execute(
-                "DELETE FROM allowed_channels WHERE guild_id = ? AND channel_id = ?",
-                (guild_id, channel_id)
-            )
-            conn.commit()
+            async with self._db_lock:
+                async with self.db.execute(
+                    "DELETE FROM allowed_channels WHERE guild_id = ? AND channel_id = ?",
+                    (guild_id, channel_id)
+                ) as cursor:
+                    removed = cursor.rowcount > 0
+                await self.db.commit()
+            self.allowed.discard((guild_id, channel_id))
             
-            if cursor.rowcount > 0:
+            if removed:
                 await ctx.send(f"✅ I'll no longer chat in {channel.mention} unless mentioned.")
             else:
                 await ctx.send(f"❓ That channel wasn't in my allowed list.")
         except Exception as e:
             await ctx.send(f"Error removing channel: {e}")
-        finally:
-            conn.close()
 
     @commands.command(name="listchannels")
     @commands.has_permissions(administrator=True)
@@ -309,11 +646,10 @@ class LumiCog(commands.Cog):
             await ctx.send("No channels have been added yet. I'll only respond when mentioned.")
             return
             
-        channel_mentions = []
-        for channel_id in allowed_channels:
-            channel = ctx.guild.get_channel(int(channel_id))
-            if channel:
-                channel_mentions.append(channel.mention)
+        channel_mentions = [
+            channel.mention for channel_id in allowed_channels
+            if (channel := ctx.guild.get_channel(int(channel_id)))
+        ]
         
         if channel_mentions:
             await ctx.send(f"I'm currently active in these channels: {', '.join(channel_mentions)}")
@@ -330,26 +666,19 @@ class LumiCog(commands.Cog):
             
         guild_id = str(ctx.guild.id)
         
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
         try:
-            # Get total messages
-            cursor.execute(
-                "SELECT COUNT(*) FROM usage_stats WHERE guild_id = ?", 
-                (guild_id,)
-            )
-            total_messages = cursor.fetchone()[0]
+            # Make sure recent interactions are counted
+            await self._flush_logs()
             
-            # Get unique users
-            cursor.execute(
-                "SELECT COUNT(DISTINCT user_id) FROM usage_stats WHERE guild_id = ?", 
+            # Get total messages and unique users
+            async with self.db.execute(
+                "SELECT COUNT(*), COUNT(DISTINCT user_id) FROM usage_stats WHERE guild_id = ?", 
                 (guild_id,)
-            )
-            unique_users = cursor.fetchone()[0]
+            ) as cursor:
+                total_messages, unique_users = await cursor.fetchone()
             
             # Get most active channel
-            cursor.execute(
+            async with self.db.execute(
                 """
                 SELECT channel_id, COUNT(*) as count 
                 FROM usage_stats 
@@ -359,8 +688,8 @@ class LumiCog(commands.Cog):
                 LIMIT 1
                 """, 
                 (guild_id,)
-            )
-            result = cursor.fetchone()
+            ) as cursor:
+                result = await cursor.fetchone()
             most_active_channel_id = result[0] if result else None
             most_active_channel = ctx.guild.get_channel(int(most_active_channel_id)) if most_active_channel_id else None
             
@@ -375,8 +704,6 @@ class LumiCog(commands.Cog):
             await ctx.send(stats_message)
         except Exception as e:
             await ctx.send(f"Error retrieving stats: {e}")
-        finally:
-            conn.close()
 
     @commands.command(name="reset")
     @commands.has_permissions(administrator=True)
@@ -385,24 +712,26 @@ class LumiCog(commands.Cog):
         target_user = user if user else ctx.author
         user_id = str(target_user.id)
         
-        if user_id in self.conversation_history:
-            self.conversation_history[user_id] = []
-            await ctx.send(f"✅ Conversation history reset for {target_user.mention}!")
-        else:
-            await ctx.send(f"No conversation history found for {target_user.mention}.")
+        async with self._history_lock(user_id):
+            if await self.get_history(user_id):
+                self.conversation_history[user_id] = []
+                await self.save_history(user_id, [])
+                await ctx.send(f"✅ Conversation history reset for {target_user.mention}!")
+            else:
+                await ctx.send(f"No conversation history found for {target_user.mention}.")
 
     @add_channel.error
     @remove_channel.error
     @list_channels.error
-    @stats.error
+    @show_stats.error
     @reset_history.error
     async def command_error(self, ctx, error):
         if isinstance(error, commands.MissingPermissions):
-            await ctx.send("You need administrator permissions to use this command.")
-        else:
-            await ctx.send(f"An error occurred: {str(error)}")
-            print(f"Command error: {error}")
-            print(traceback.format_exc())
+            return await ctx.send(self._perm_error_msg)
+        
+        await ctx.send(f"An error occurred: {error}")
+        print(f"Command error: {error}")
+        print("".join(traceback.format_exception(error)))
 
 def setup(bot):
     bot.add_cog(LumiCog(bot))
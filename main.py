@@ -8,6 +8,12 @@ from nextcord import *
 from colorama import init, Fore
 
 init(autoreset=True)
+
+# uvloop is a faster drop-in event loop; it must be installed before the bot creates its loop
+if sys.platform != "win32":
+    import uvloop
+    uvloop.install()
+
 os.makedirs('db', exist_ok=True)
 bot = commands.Bot(intents=Intents.all(), help_command=None, command_prefix='!')
 